@@ -0,0 +1,111 @@
+"""
+Compression benchmark: CPU cost against bytes saved for each codec and level
+
+Builds payloads shaped like what /ws and /data/ send (a full hour of cold
+spray rows, a batch of base64 mic frames, the combined snapshot) and reports,
+per codec and level, the median compression time, throughput and savings.
+
+    python benchmark_compression.py [--repeat 20]
+"""
+import argparse
+import base64
+import gzip
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+from data_generator import generate_coldspray_batch, generate_mic_frames
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_LEVELS = [1, 3, 6, 9]
+ZSTD_LEVELS = [1, 3, 6, 12, 19]
+
+
+def build_payloads():
+    start = datetime.now() - timedelta(hours=1)
+    rows = generate_coldspray_batch(start, 3600, rate=1.0)
+    cold_spray = [
+        {
+            "Time": row["Time"].isoformat(),
+            "T_gun": row["T_Gun"],
+            "P_gun": row["P_Gun"],
+            "Q_PG_N2": row["Q_PG_N2"],
+            "V_Particule": row["V_Particule"],
+            "Q_CG_PF1": row["Q_CG_PF1"],
+            "Q_CG_PF2": row["Q_CG_PF2"],
+        }
+        for row in rows
+    ]
+
+    def mic(collection_name):
+        frames = generate_mic_frames(start, 10, sample_rate=8000, frame_duration=0.25)
+        return [
+            {
+                "timestamp": frame["timestamp"].isoformat(),
+                "data": base64.b64encode(frame["data"]).decode("utf-8"),
+                "mic_id": collection_name,
+                "machine_id": "machine_0",
+            }
+            for frame in frames
+        ]
+
+    micro_0, micro_1 = mic("micro_0"), mic("micro_1")
+    return {
+        "cold_spray_hour": json.dumps({"machine_id": "machine_0", "cold_spray": cold_spray}),
+        "mic_frames": json.dumps({"machine_id": "machine_0", "micro_0": micro_0, "micro_1": micro_1}),
+        "snapshot": json.dumps({
+            "machine_id": "machine_0",
+            "cold_spray": cold_spray,
+            "micro_0": micro_0,
+            "micro_1": micro_1,
+        }),
+    }
+
+
+def codecs():
+    yield "gzip", GZIP_LEVELS, lambda data, level: gzip.compress(data, compresslevel=level, mtime=0)
+    if zstandard is not None:
+        yield "zstd", ZSTD_LEVELS, lambda data, level: zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def measure(compress, data, level, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        compressed = compress(data, level)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), len(compressed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per measurement, the median is reported")
+    args = parser.parse_args()
+
+    if zstandard is None:
+        print("zstandard not installed, reporting gzip only\n")
+
+    header = f"{'payload':<16}{'codec':<7}{'level':>6}{'raw KiB':>10}{'out KiB':>10}{'saved':>8}{'ms':>9}{'MiB/s':>9}{'KiB saved/ms':>14}"
+    print(header)
+    print("-" * len(header))
+    for name, text in build_payloads().items():
+        data = text.encode("ascii")
+        for codec, levels, compress in codecs():
+            for level in levels:
+                seconds, size = measure(compress, data, level, args.repeat)
+                saved = len(data) - size
+                print(
+                    f"{name:<16}{codec:<7}{level:>6}"
+                    f"{len(data) / 1024:>10.1f}{size / 1024:>10.1f}{saved / len(data):>8.1%}"
+                    f"{seconds * 1000:>9.2f}{len(data) / seconds / 2 ** 20:>9.1f}"
+                    f"{saved / 1024 / (seconds * 1000):>14.1f}"
+                )
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import gzip
+import logging
+import time
+from typing import Dict, List, Optional
+from config import get_settings
+from metrics import COMPRESSION_DURATION, COMPRESSION_BYTES_SAVED
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always available
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Preferred first when a client accepts several
+SUPPORTED_CODECS = ["zstd", "gzip"]
+
+
+def available_codecs() -> List[str]:
+    return [codec for codec in SUPPORTED_CODECS if codec != "zstd" or zstandard is not None]
+
+
+def default_level(codec: str) -> int:
+    settings = get_settings()
+    return settings.ZSTD_LEVEL if codec == "zstd" else settings.GZIP_LEVEL
+
+
+def compress(data: bytes, codec: str, level: Optional[int] = None) -> bytes:
+    """Compress data with the given codec, recording CPU time and bytes saved"""
+    if level is None:
+        level = default_level(codec)
+    started = time.perf_counter()
+    if codec == "gzip":
+        # mtime=0 keeps output deterministic so identical payloads compress identically
+        compressed = gzip.compress(data, compresslevel=level, mtime=0)
+    elif codec == "zstd" and zstandard is not None:
+        compressed = zstandard.ZstdCompressor(level=level).compress(data)
+    else:
+        raise ValueError(f"Unsupported codec: {codec}")
+    COMPRESSION_DURATION.labels(codec).observe(time.perf_counter() - started)
+    # Incompressible input can grow slightly; a counter must never go down
+    COMPRESSION_BYTES_SAVED.labels(codec).inc(max(len(data) - len(compressed), 0))
+    return compressed
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick a codec from an Accept-Encoding style header
+
+    Args:
+        accept_encoding: e.g. "gzip, deflate, br, zstd" or "gzip;q=0.5, zstd;q=1"
+
+    Returns:
+        The best available codec, or None to send uncompressed
+    """
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name.strip().lower()] = quality
+
+    candidates = [
+        codec for codec in available_codecs()
+        if weights.get(codec, weights.get("*", 0)) > 0
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda codec: weights.get(codec, weights.get("*", 0)))
+
+
+class EncodedMessage:
+    """
+    A serialized message shared by every recipient of one broadcast
+
+    Compressed variants are produced on first use and cached, so each codec
+    costs one compression per message however many clients receive it.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.compressible = len(text) >= get_settings().COMPRESSION_MIN_SIZE
+        self._compressed: Dict[str, bytes] = {}
+
+    def compressed(self, codec: str) -> bytes:
+        data = self._compressed.get(codec)
+        if data is None:
+            # json.dumps escapes non-ASCII by default, so ASCII encoding is lossless
+            data = compress(self.text.encode("ascii"), codec)
+            self._compressed[codec] = data
+        return data
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing HTTP responses with gzip or zstd
+
+    Unlike Starlette's GZipMiddleware this negotiates zstd as well and shares
+    the COMPRESSION_MIN_SIZE threshold with the WebSocket path. Responses are
+    buffered, which is fine for the JSON endpoints this service exposes.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        codec = negotiate(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if codec is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        body_parts = []
+
+        async def buffered_send(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body_parts.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(body_parts)
+            response_headers = [
+                (name, value) for name, value in start_message.get("headers", [])
+                if name.lower() != b"content-length"
+            ]
+            already_encoded = any(name.lower() == b"content-encoding" for name, _ in response_headers)
+            if len(body) >= get_settings().COMPRESSION_MIN_SIZE and not already_encoded:
+                body = compress(body, codec)
+                response_headers.append((b"content-encoding", codec.encode("latin-1")))
+                response_headers.append((b"vary", b"Accept-Encoding"))
+            response_headers.append((b"content-length", str(len(body)).encode("latin-1")))
+
+            await send({**start_message, "headers": response_headers})
+            await send({"type": "http.response.body", "body": body, "more_body": False})
+
+        await self.app(scope, receive, buffered_send)
@@ -2,6 +2,7 @@ import os
 from pydantic_settings import BaseSettings
 from pydantic import Field
 from functools import lru_cache
+from typing import List
 
 class Settings(BaseSettings):
     # MongoDB settings
@@ -10,6 +11,13 @@ class Settings(BaseSettings):
         env="MONGODB_URI"
     )
     MONGODB_DB_NAME: str = Field(default="DataIngestion", env="MONGODB_DB_NAME")
+    MONGODB_MIN_POOL_SIZE: int = Field(default=4, env="MONGODB_MIN_POOL_SIZE")
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = Field(default=5000, env="MONGODB_SERVER_SELECTION_TIMEOUT_MS")
+    
+    # Machine settings. Documents stored before machines were tracked carry no
+    # machine_id and are attributed to DEFAULT_MACHINE_ID.
+    MACHINE_IDS: List[str] = Field(default=["machine_0"], env="MACHINE_IDS")
+    DEFAULT_MACHINE_ID: str = Field(default="machine_0", env="DEFAULT_MACHINE_ID")
     
     # Data thresholds
     MAX_T_GUN: float = Field(default=10.0, env="MAX_T_GUN")
@@ -23,8 +31,41 @@ class Settings(BaseSettings):
     Q_PG_N2_MAINTENANCE_THRESHOLD: float = Field(default=10.0, env="Q_PG_N2_MAINTENANCE_THRESHOLD")
     V_PARTICULE_MAINTENANCE_THRESHOLD: float = Field(default=10.0, env="V_PARTICULE_MAINTENANCE_THRESHOLD")
     
-    # WebSocket settings
-    BROADCAST_INTERVAL: int = Field(default=1, env="BROADCAST_INTERVAL")  # seconds
+    # Event detection: readings further apart than this start a new event
+    EVENT_GAP_SECONDS: float = Field(default=5.0, env="EVENT_GAP_SECONDS")
+    # Longer excursions are split; also bounds the index scan of event queries
+    EVENT_MAX_DURATION_SECONDS: float = Field(default=3600.0, env="EVENT_MAX_DURATION_SECONDS")
+    
+    # Startup settings. "lazy" starts listening immediately and warms Mongo and
+    # the live snapshot in the background, /ready flips once that is done.
+    # "eager" connects (off the event loop) before startup completes and only
+    # falls back to the background retry loop if Mongo is down at boot.
+    STARTUP_MODE: str = Field(default="lazy", env="STARTUP_MODE")
+    # Cached live snapshots younger than this are sent to new clients as-is
+    SNAPSHOT_MAX_AGE: float = Field(default=30.0, env="SNAPSHOT_MAX_AGE")  # seconds
+    
+    # WebSocket settings. BROADCAST_INTERVAL is the cold spray channel period;
+    # channels slow down to at most BROADCAST_MAX_SLOWDOWN x their period under load.
+    BROADCAST_INTERVAL: float = Field(default=1.0, env="BROADCAST_INTERVAL")  # seconds
+    MIC_BROADCAST_INTERVAL: float = Field(default=0.25, env="MIC_BROADCAST_INTERVAL")  # seconds
+    MAINTENANCE_BROADCAST_INTERVAL: float = Field(default=5.0, env="MAINTENANCE_BROADCAST_INTERVAL")  # seconds
+    BROADCAST_MAX_SLOWDOWN: float = Field(default=8.0, env="BROADCAST_MAX_SLOWDOWN")
+    # Compression. Payloads smaller than COMPRESSION_MIN_SIZE bytes go out as-is.
+    # Clients connecting with /ws?compression=gzip|zstd get binary frames
+    # compressed once per broadcast and shared by every recipient.
+    # WS_PER_MESSAGE_DEFLATE lets uvicorn negotiate permessage-deflate instead,
+    # which every browser offers and which recompresses each frame per connection
+    # with no size threshold, so it is off by default. ASGI does not tell the app
+    # what was negotiated, so the two are not reconciled per client: keep it off
+    # when clients use ?compression. Only `python main.py` applies this setting;
+    # uvicorn's own default is on, so run `uvicorn main:app --ws-per-message-deflate false`.
+    COMPRESSION_MIN_SIZE: int = Field(default=1024, env="COMPRESSION_MIN_SIZE")
+    GZIP_LEVEL: int = Field(default=1, env="GZIP_LEVEL")
+    ZSTD_LEVEL: int = Field(default=3, env="ZSTD_LEVEL")
+    WS_PER_MESSAGE_DEFLATE: bool = Field(default=False, env="WS_PER_MESSAGE_DEFLATE")
+    
+    # Pings go only to connections that have been sent nothing for this long
+    KEEPALIVE_INTERVAL: float = Field(default=10.0, env="KEEPALIVE_INTERVAL")  # seconds
     
     class Config:
         env_file = ".env"
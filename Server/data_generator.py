@@ -1,7 +1,15 @@
 import random
+import asyncio
+import heapq
+import logging
 from datetime import datetime, timedelta
 import numpy as np
 import base64
+import json
+import urllib.error
+import urllib.request
+
+logger = logging.getLogger(__name__)
 
 def generate_sample_coldspray_data(num_points=50):
     """Generate sample cold spray data for testing"""
@@ -50,3 +58,420 @@ def generate_mic_waveform(num_samples=100):
         "timestamp": datetime.now(),    
         "data": base64_data,
     }
+
+
+# ---------------------------------------------------------------------------
+# High-rate simulator
+# ---------------------------------------------------------------------------
+
+FAULT_SCENARIOS = ["none", "drift", "spike", "clog"]
+
+# Column -> (base, noise half-width, pattern period), matching generate_sample_coldspray_data
+COLDSPRAY_PROFILE = {
+    "T_Gun": (45.0, 5.0, 10),
+    "P_Gun": (45.0, 3.0, 5),
+    "Q_PG_N2": (45.0, 2.0, 7),
+    "V_Particule": (45.0, 2.0, 7),
+    "Q_CG_PF1": (45.0, 1.0, 3),
+    "Q_CG_PF2": (45.0, 1.0, 3),
+}
+
+
+def _apply_coldspray_fault(columns, elapsed, fault, rng):
+    """Inject a fault scenario into generated cold spray columns in place"""
+    if fault == "drift":
+        # Slow heating of the gun with pressure following, ~0.5 unit/min
+        columns["T_Gun"] += elapsed * (0.5 / 60)
+        columns["P_Gun"] += elapsed * (0.2 / 60)
+    elif fault == "spike":
+        # Rare, short excursions well above the normal band
+        for name in ("T_Gun", "P_Gun", "V_Particule"):
+            mask = rng.random(len(elapsed)) < 0.02
+            columns[name][mask] += rng.uniform(20, 40, mask.sum())
+    elif fault == "clog":
+        # Feeders choke progressively and particle velocity sags
+        choke = np.clip(elapsed / 600, 0, 1)
+        columns["Q_CG_PF1"] *= 1 - 0.6 * choke
+        columns["Q_CG_PF2"] *= 1 - 0.6 * choke
+        columns["V_Particule"] *= 1 - 0.3 * choke
+
+
+def generate_coldspray_batch(start_time, num_points, rate=1.0, fault="none", machine_id=None,
+                             elapsed_offset=0.0, rng=None, first_index=0):
+    """
+    Generate a batch of cold spray rows with NumPy
+
+    Args:
+        start_time: Timestamp of the first row
+        num_points: Number of rows to generate
+        rate: Sampling rate in Hz
+        fault: One of FAULT_SCENARIOS
+        machine_id: Optional machine tag added to every row
+        elapsed_offset: Seconds since the scenario started, so faults evolve across batches
+        rng: Optional numpy Generator for reproducible runs
+        first_index: Stream position of the first row, so the patterns continue across batches
+
+    Returns:
+        List of documents ready for insertion
+    """
+    rng = rng or np.random.default_rng()
+    index = np.arange(num_points)
+    elapsed = elapsed_offset + index / rate
+
+    columns = {}
+    for name, (base, noise, period) in COLDSPRAY_PROFILE.items():
+        columns[name] = base + rng.uniform(-noise, noise, num_points) + ((first_index + index) % period)
+    _apply_coldspray_fault(columns, elapsed, fault, rng)
+
+    step = timedelta(seconds=1 / rate)
+    names = list(columns)
+    rows = []
+    for i, values in enumerate(zip(*(columns[name].tolist() for name in names))):
+        row = {"Time": start_time + i * step}
+        row.update(zip(names, values))
+        if machine_id is not None:
+            row["machine_id"] = machine_id
+        rows.append(row)
+    return rows
+
+
+def generate_mic_frames(start_time, num_frames, sample_rate=8000, frame_duration=0.25, fault="none",
+                        machine_id=None, elapsed_offset=0.0, rng=None):
+    """
+    Generate consecutive microphone frames of float32 audio
+
+    All frames of a batch are synthesised in one vectorised pass and then split.
+    Frame payloads are raw bytes, the same layout the microphone service
+    base64-encodes on the way out.
+    """
+    rng = rng or np.random.default_rng()
+    samples_per_frame = max(1, int(sample_rate * frame_duration))
+    total = samples_per_frame * num_frames
+    t = elapsed_offset + np.arange(total) / sample_rate
+
+    frequency = rng.uniform(100, 200)
+    amplitude = rng.uniform(0.5, 1.0)
+    waveform = amplitude * np.sin(2 * np.pi * frequency * t)
+    waveform += 0.3 * np.sin(2 * np.pi * frequency * 2 * t)
+    waveform += 0.15 * np.sin(2 * np.pi * frequency * 3 * t)
+    waveform += rng.normal(0, 0.05, total)
+
+    if fault == "clog":
+        # Clogging shows up as growing broadband hiss and a rattling envelope
+        severity = np.clip(t / 600, 0, 1)
+        waveform += severity * rng.normal(0, 0.4, total)
+        waveform *= 1 + 0.5 * severity * np.sin(2 * np.pi * 7 * t)
+    elif fault == "spike":
+        clicks = rng.random(total) < 0.001
+        waveform[clicks] += rng.choice([-1.0, 1.0], clicks.sum()) * 3.0
+    elif fault == "drift":
+        waveform *= 1 + t * (0.1 / 60)
+
+    frames = waveform.astype(np.float32).reshape(num_frames, samples_per_frame)
+    step = timedelta(seconds=frame_duration)
+    documents = []
+    for i in range(num_frames):
+        document = {
+            "timestamp": start_time + i * step,
+            "data": frames[i].tobytes(),
+        }
+        if machine_id is not None:
+            document["machine_id"] = machine_id
+        documents.append(document)
+    return documents
+
+
+async def _mongo_sink(collection_name, documents, server_url=None):
+    from database import db
+    collection = db.get_collection(collection_name)
+    if collection is None or not documents:
+        return 0
+    result = await asyncio.to_thread(collection.insert_many, documents, ordered=False)
+    return len(result.inserted_ids)
+
+
+def _encode_for_ingest(document):
+    """Make a generated document JSON-safe for POST /ingest/{collection}"""
+    encoded = {}
+    for key, value in document.items():
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, bytes):
+            value = base64.b64encode(value).decode("utf-8")
+        encoded[key] = value
+    return encoded
+
+
+def _post(url, payload):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+
+async def _ingest_sink(collection_name, documents, server_url="http://localhost:8000"):
+    # Goes through the running server, so its ingest metrics and event detection apply
+    if not documents:
+        return 0
+    payload = {"documents": [_encode_for_ingest(document) for document in documents]}
+    try:
+        response = await asyncio.to_thread(_post, f"{server_url}/ingest/{collection_name}", payload)
+    except (urllib.error.URLError, OSError) as e:
+        logger.error(f"Ingest request for {collection_name} failed: {e}")
+        return 0
+    return response["inserted"]
+
+
+SINKS = {
+    "mongo": _mongo_sink,
+    "ingest": _ingest_sink,
+}
+
+
+class _StreamClock:
+    """
+    Sample clock for one stream
+
+    Tracks how many samples are due since the start rather than rounding per
+    tick, so fractional and sub-tick rates come out exact over time and
+    consecutive batches neither overlap nor leave gaps.
+    """
+
+    def __init__(self, start, rate):
+        self.start = start
+        self.rate = rate
+        self.emitted = 0
+        self._due = 0.0
+
+    def advance(self, seconds):
+        """Return (index of first sample, sample count) due in the next `seconds`"""
+        self._due += seconds * self.rate
+        first = self.emitted
+        # The epsilon stops float error (e.g. 10 x 0.2 = 1.9999...) from losing a sample
+        self.emitted = int(self._due + 1e-9)
+        return first, self.emitted - first
+
+    def time_of(self, index):
+        return self.start + timedelta(seconds=index / self.rate)
+
+
+class SensorSimulator:
+    """
+    Stream synthetic cold spray and microphone data for N machines
+
+    Each tick generates `tick_interval` seconds of data per machine in one
+    vectorised batch and hands it to the sink. Ticks are scheduled against the
+    event loop clock so the stream rate does not drift with write latency, and
+    data timestamps come from per-stream sample clocks.
+    """
+
+    def __init__(self, num_machines=1, coldspray_rate=1.0, mic_sample_rate=8000, mic_frame_duration=0.25,
+                 fault="none", sink="mongo", tick_interval=1.0, seed=None, server_url="http://localhost:8000"):
+        if fault not in FAULT_SCENARIOS:
+            raise ValueError(f"Unknown fault scenario: {fault}")
+        if sink not in SINKS:
+            raise ValueError(f"Unknown sink: {sink}")
+        self.num_machines = num_machines
+        self.coldspray_rate = coldspray_rate
+        self.mic_sample_rate = mic_sample_rate
+        self.mic_frame_duration = mic_frame_duration
+        self.fault = fault
+        self.sink = SINKS[sink]
+        self.server_url = server_url
+        self.tick_interval = tick_interval
+        self.rng = np.random.default_rng(seed)
+        self.rows_written = 0
+        self._running = False
+        self._coldspray_clock = None
+        self._mic_clock = None
+
+    def _machine_ids(self):
+        # Matches the default MACHINE_IDS naming; extend MACHINE_IDS to serve more
+        return [f"machine_{i}" for i in range(self.num_machines)]
+
+    def _start_clocks(self, start):
+        self._coldspray_clock = _StreamClock(start, self.coldspray_rate)
+        self._mic_clock = _StreamClock(start, 1 / self.mic_frame_duration)
+
+    async def tick(self):
+        """Generate and write the data that fell due during one tick for every machine"""
+        if self._coldspray_clock is None:
+            self._start_clocks(datetime.now() - timedelta(seconds=self.tick_interval))
+        first_row, coldspray_points = self._coldspray_clock.advance(self.tick_interval)
+        first_frame, mic_frames = self._mic_clock.advance(self.tick_interval)
+
+        written = 0
+        for machine_id in self._machine_ids():
+            if coldspray_points:
+                rows = generate_coldspray_batch(
+                    self._coldspray_clock.time_of(first_row), coldspray_points, self.coldspray_rate,
+                    self.fault, machine_id, first_row / self.coldspray_rate, self.rng, first_row,
+                )
+                written += await self.sink("coldspray", rows, self.server_url)
+            if mic_frames:
+                for mic in ("micro_0", "micro_1"):
+                    frames = generate_mic_frames(
+                        self._mic_clock.time_of(first_frame), mic_frames, self.mic_sample_rate,
+                        self.mic_frame_duration, self.fault, machine_id,
+                        first_frame * self.mic_frame_duration, self.rng,
+                    )
+                    written += await self.sink(mic, frames, self.server_url)
+        self.rows_written += written
+        return written
+
+    async def run(self, duration=None):
+        """Stream until stopped or until `duration` seconds have elapsed"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        next_tick = started
+        # The first tick covers the interval that just ended, so no row is stamped in the future
+        self._start_clocks(datetime.now() - timedelta(seconds=self.tick_interval))
+        self._running = True
+        while self._running:
+            if duration is not None and next_tick - started >= duration:
+                break
+            await self.tick()
+            next_tick += self.tick_interval
+            delay = next_tick - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                logger.warning(f"Simulator running {-delay:.3f}s behind schedule")
+        self._running = False
+        return self.rows_written
+
+    def stop(self):
+        self._running = False
+
+
+async def replay_day(day, speed=1.0, sink="mongo", collections=("coldspray", "micro_0", "micro_1"),
+                     server_url="http://localhost:8000"):
+    """
+    Replay a recorded day at `speed`x, re-stamped to the current time
+
+    Args:
+        day: Date in the same "%m/%d/%Y" format used by the REST filter
+        speed: Playback multiplier, 10 replays an hour in six minutes
+        sink: Name of the sink in SINKS
+        collections: Collections to replay
+        server_url: Server receiving the batches when sink is "ingest"
+
+    Returns:
+        Number of documents written
+    """
+    from database import db
+
+    write = SINKS[sink]
+    day_start = datetime.strptime(day, "%m/%d/%Y")
+    day_end = day_start + timedelta(days=1)
+
+    def stream(collection_name):
+        time_field = "Time" if collection_name == "coldspray" else "timestamp"
+        collection = db.get_collection(collection_name)
+        if collection is None:
+            return
+        cursor = collection.find(
+            {time_field: {"$gte": day_start, "$lt": day_end}},
+            {"_id": 0},
+        ).sort(time_field, 1)
+        for document in cursor:
+            yield document[time_field], collection_name, time_field, document
+
+    # Merge all collections into one time-ordered stream
+    merged = heapq.merge(*(stream(name) for name in collections), key=lambda entry: entry[0])
+
+    loop = asyncio.get_running_loop()
+    wall_start = None
+    replay_start = datetime.now()
+    # Offsets are measured from the first recorded document, not midnight,
+    # so a day that starts at 08:00 begins replaying immediately
+    origin = None
+    batches = {}
+    batch_due = None
+    written = 0
+
+    async def flush():
+        nonlocal written
+        for collection_name, documents in batches.items():
+            written += await write(collection_name, documents, server_url)
+        batches.clear()
+
+    for recorded_at, collection_name, time_field, document in merged:
+        if origin is None:
+            origin = recorded_at
+            wall_start = loop.time()
+        offset = (recorded_at - origin).total_seconds() / speed
+        # Group everything due within the same 100 ms window into one write
+        if batch_due is not None and offset - batch_due >= 0.1:
+            await flush()
+            batch_due = None
+        if batch_due is None:
+            batch_due = offset
+            delay = wall_start + offset - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        document[time_field] = replay_start + timedelta(seconds=offset)
+        batches.setdefault(collection_name, []).append(document)
+    await flush()
+    return written
+
+
+def main():
+    import argparse
+    from database import db
+
+    parser = argparse.ArgumentParser(description="Remanet synthetic sensor simulator")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    simulate = subparsers.add_parser("simulate", help="Stream synthetic data")
+    simulate.add_argument("--machines", type=int, default=1)
+    simulate.add_argument("--coldspray-rate", type=float, default=1.0, help="Rows per second per machine")
+    simulate.add_argument("--mic-rate", type=int, default=8000, help="Audio samples per second")
+    simulate.add_argument("--mic-frame", type=float, default=0.25, help="Seconds of audio per mic document")
+    simulate.add_argument("--fault", choices=FAULT_SCENARIOS, default="none")
+    simulate.add_argument("--duration", type=float, default=None, help="Seconds to run, forever if omitted")
+    simulate.add_argument("--sink", choices=list(SINKS), default="mongo",
+                          help="Write to Mongo directly, or POST to a running server's /ingest")
+    simulate.add_argument("--server", default="http://localhost:8000", help="Server URL for the ingest sink")
+    simulate.add_argument("--seed", type=int, default=None)
+
+    replay = subparsers.add_parser("replay", help="Replay a recorded day")
+    replay.add_argument("day", help="Date as MM/DD/YYYY")
+    replay.add_argument("--speed", type=float, default=1.0)
+    replay.add_argument("--sink", choices=list(SINKS), default="mongo")
+    replay.add_argument("--server", default="http://localhost:8000", help="Server URL for the ingest sink")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    # The ingest sink only talks to the server; replays still read from Mongo
+    if (args.command == "replay" or args.sink == "mongo") and not db.initialize():
+        raise SystemExit(1)
+    try:
+        if args.command == "simulate":
+            simulator = SensorSimulator(
+                num_machines=args.machines,
+                coldspray_rate=args.coldspray_rate,
+                mic_sample_rate=args.mic_rate,
+                mic_frame_duration=args.mic_frame,
+                fault=args.fault,
+                sink=args.sink,
+                seed=args.seed,
+                server_url=args.server,
+            )
+            written = asyncio.run(simulator.run(args.duration))
+        else:
+            written = asyncio.run(replay_day(args.day, args.speed, args.sink, server_url=args.server))
+        logger.info(f"Wrote {written} documents")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
-from pymongo import MongoClient
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from config import get_settings
 
 # Set up proper logging
@@ -16,16 +16,61 @@ class Database:
         return cls._instance
     
     def initialize(self):
+        # Imported here so the server can start listening before pymongo loads
+        from pymongo import MongoClient
+
         settings = get_settings()
+        client = None
         try:
-            self.client = MongoClient(settings.MONGODB_URI)
-            self.db = self.client[settings.MONGODB_DB_NAME]
+            client = MongoClient(
+                settings.MONGODB_URI,
+                minPoolSize=settings.MONGODB_MIN_POOL_SIZE,
+                serverSelectionTimeoutMS=settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+            )
+            # MongoClient connects lazily; ping so failures surface here, not on the first query
+            client.admin.command("ping")
+            # Only publish the handles once the server answered, so db.db means connected
+            self.client = client
+            self.db = client[settings.MONGODB_DB_NAME]
             logger.info("MongoDB connection successful")
+            self.ensure_indexes()
             return True
         except Exception as e:
             logger.error(f"MongoDB connection error: {e}")
+            if client is not None:
+                client.close()
             return False
     
+    def warm_up(self, connections=None):
+        """Open `connections` pooled sockets up front by pinging concurrently"""
+        if self.client is None:
+            return 0
+        connections = connections or get_settings().MONGODB_MIN_POOL_SIZE
+
+        def ping(_):
+            self.client.admin.command("ping")
+
+        try:
+            # Overlapping pings check out sockets in parallel, growing the pool
+            with ThreadPoolExecutor(max_workers=connections) as executor:
+                list(executor.map(ping, range(connections)))
+            logger.info(f"MongoDB pool warmed with {connections} connections")
+            return connections
+        except Exception as e:
+            logger.error(f"MongoDB warm-up error: {e}")
+            return 0
+    
+    def ensure_indexes(self):
+        """Create the (machine_id, time) compound indexes and the event index"""
+        try:
+            self.db["coldspray"].create_index([("machine_id", 1), ("Time", 1)])
+            for collection_name in ("micro_0", "micro_1"):
+                self.db[collection_name].create_index([("machine_id", 1), ("timestamp", 1)])
+            self.db["events"].create_index([("machine_id", 1), ("parameter", 1), ("start", 1)])
+            self.db["events"].create_index([("start", 1), ("end", 1)])
+        except Exception as e:
+            logger.error(f"MongoDB index creation error: {e}")
+    
     def get_collection(self, collection_name):
         if self.db is not None:
             return self.db[collection_name]
@@ -37,3 +82,12 @@ class Database:
             logger.info("MongoDB connection closed")
 
 db = Database()
+
+def machine_filter(machine_id=None):
+    """Build the Mongo filter selecting one machine's documents"""
+    settings = get_settings()
+    machine_id = machine_id or settings.DEFAULT_MACHINE_ID
+    if machine_id == settings.DEFAULT_MACHINE_ID:
+        # Legacy single-cell documents have no machine_id at all
+        return {"machine_id": {"$in": [machine_id, None]}}
+    return {"machine_id": machine_id}
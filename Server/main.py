@@ -1,13 +1,25 @@
+import time
+
+# Taken before the remaining imports so the import phase is measured too
+_process_started = time.perf_counter()
+
+import asyncio
 import json
 import logging
 from datetime import datetime
-from typing import Optional
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query, Depends
+from typing import Optional, List, Dict, Any
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, JSONResponse
+from pydantic import BaseModel
 from config import get_settings, Settings
 from database import db
 from websocket_manager import ConnectionManager
-from services.coldspray_service import get_filtered_data
+from services.coldspray_service import get_filtered_data, get_fleet_overview
+from services.ingest_service import ingest_coldspray, ingest_mic, decode_documents, MIC_COLLECTIONS
+from services.event_service import get_events, get_event_window, watch_coldspray_inserts
+from compression import CompressionMiddleware
+from metrics import registry, CONTENT_TYPE_LATEST, STARTUP_PHASE_DURATION
 
 # Set up proper logging
 logging.basicConfig(
@@ -28,21 +40,81 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip/zstd for REST responses above COMPRESSION_MIN_SIZE
+app.add_middleware(CompressionMiddleware)
+
 # Create connection manager instance
 manager = ConnectionManager()
 
+# Flipped once Mongo and the live snapshot are warm; gates /ready
+app_ready = False
+warm_up_task = None
+event_watcher_task = None
+
+# Backoff bounds in seconds between warm-up attempts while Mongo is unreachable
+WARM_UP_RETRY_MIN = 1.0
+WARM_UP_RETRY_MAX = 30.0
+
 # REST endpoint for testing
 @app.get("/data/")
 async def get_data(
     filter_date: Optional[str] = Query(None),
+    machine_id: Optional[str] = Query(None),
     settings: Settings = Depends(get_settings)
 ):
-    return await get_filtered_data(filter_date)
+    return await get_filtered_data(filter_date, machine_id)
+
+# Latest state of every machine in one round-trip
+@app.get("/fleet")
+async def get_fleet():
+    return {"machines": await get_fleet_overview()}
+
+# Recorded threshold/maintenance events overlapping a time range
+@app.get("/events/")
+async def list_events(
+    start: datetime = Query(...),
+    end: datetime = Query(...),
+    machine_id: Optional[str] = Query(None),
+    parameter: Optional[str] = Query(None),
+    severity: Optional[str] = Query(None),
+    limit: int = Query(1000, ge=1, le=10000)
+):
+    return {"events": await get_events(start, end, machine_id, parameter, severity, limit)}
+
+# Raw cold spray and mic data around one event
+@app.get("/events/{event_id}/window")
+async def event_window(event_id: str, padding: float = Query(60, ge=0, le=3600)):
+    window = await get_event_window(event_id, padding)
+    if window is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    return window
+
+class IngestBatch(BaseModel):
+    documents: List[Dict[str, Any]]
+    machine_id: Optional[str] = None
+
+# Live writers (e.g. data_generator --sink ingest) push batches here; the
+# broadcast channels pick them up on their next tick
+@app.post("/ingest/{collection_name}")
+async def ingest(collection_name: str, batch: IngestBatch):
+    if collection_name != "coldspray" and collection_name not in MIC_COLLECTIONS:
+        raise HTTPException(status_code=404, detail=f"Unknown collection {collection_name}")
+    if db.db is None:
+        raise HTTPException(status_code=503, detail="MongoDB not connected")
+    try:
+        documents = decode_documents(collection_name, batch.documents)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid documents: {e}")
+    if collection_name == "coldspray":
+        inserted = await ingest_coldspray(documents, batch.machine_id)
+    else:
+        inserted = await ingest_mic(collection_name, documents, batch.machine_id)
+    return {"inserted": inserted}
 
 # WebSocket endpoint
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, compression: Optional[str] = Query(None)):
+    await manager.connect(websocket, compression)
     
     # Start broadcast task
     manager.start_broadcast_task()
@@ -56,9 +128,9 @@ async def websocket_endpoint(websocket: WebSocket):
             try:
                 message = json.loads(data)
                 
-                # Update filter if received
-                if "filter_date" in message:
-                    await manager.update_filter(websocket, message["filter_date"])
+                # Update filter and/or machine subscription if received
+                if "filter_date" in message or "machine_id" in message:
+                    await manager.update_subscription(websocket, message)
                 
                 # Handle ping messages
                 if message.get("type") == "ping":
@@ -85,19 +157,99 @@ async def health_check():
         "mongodb": "connected" if db.db is not None else "disconnected"
     }
 
+# Prometheus metrics endpoint
+@app.get("/metrics")
+async def metrics():
+    return Response(content=registry.generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+# Liveness: the process is up and serving requests
+@app.get("/live")
+async def liveness_check():
+    return {"status": "alive"}
+
+# Readiness: only route traffic here once warm-up has finished
+@app.get("/ready")
+async def readiness_check():
+    body = {
+        "status": "ready" if app_ready else "warming_up",
+        "mongodb": "connected" if db.db is not None else "disconnected",
+        "first_client_ttfb_ms": round(manager.first_client_ttfb * 1000, 1) if manager.first_client_ttfb is not None else None
+    }
+    return JSONResponse(content=body, status_code=200 if app_ready else 503)
+
+async def _warm_up_once():
+    global app_ready
+    settings = get_settings()
+
+    phase_started = time.perf_counter()
+    if not await asyncio.to_thread(db.initialize):
+        raise ConnectionError("MongoDB unreachable")
+    STARTUP_PHASE_DURATION.labels("mongo").set(time.perf_counter() - phase_started)
+
+    phase_started = time.perf_counter()
+    await asyncio.to_thread(db.warm_up)
+    STARTUP_PHASE_DURATION.labels("pool").set(time.perf_counter() - phase_started)
+
+    # Runs the first (cold) queries now instead of on the first client's connect
+    phase_started = time.perf_counter()
+    await asyncio.gather(*(manager.get_live_snapshot(machine_id, max_age=0) for machine_id in settings.MACHINE_IDS))
+    STARTUP_PHASE_DURATION.labels("snapshot").set(time.perf_counter() - phase_started)
+
+    manager.start_broadcast_task()
+    start_event_watcher()
+    app_ready = True
+    ready_after = time.perf_counter() - _process_started
+    STARTUP_PHASE_DURATION.labels("ready").set(ready_after)
+    logger.info(f"Warm-up complete, ready after {ready_after:.2f}s")
+
+async def warm_up():
+    """Connect to Mongo, fill the pool and pre-build live snapshots, then mark ready"""
+    # Retry until Mongo answers; /ready keeps reporting 503 in the meantime
+    delay = WARM_UP_RETRY_MIN
+    while True:
+        try:
+            await _warm_up_once()
+            return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Warm-up failed, retrying in {delay:.0f}s: {e}")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, WARM_UP_RETRY_MAX)
+
+def start_event_watcher():
+    """Index threshold excursions from every coldspray insert, whoever the writer is"""
+    global event_watcher_task
+    if event_watcher_task is None or event_watcher_task.done():
+        event_watcher_task = asyncio.create_task(watch_coldspray_inserts())
+
 # Startup event
 @app.on_event("startup")
 async def startup_event():
-    # Initialize database connection
-    db.initialize()
-    # Start the broadcast task
-    manager.start_broadcast_task()
+    global app_ready, warm_up_task
+    settings = get_settings()
+    STARTUP_PHASE_DURATION.labels("import").set(time.perf_counter() - _process_started)
+
+    if settings.STARTUP_MODE == "eager" and await asyncio.to_thread(db.initialize):
+        # Start the broadcast task
+        manager.start_broadcast_task()
+        start_event_watcher()
+        app_ready = True
+    else:
+        if settings.STARTUP_MODE == "eager":
+            logger.error("MongoDB unavailable at startup, retrying in the background")
+        # Listen immediately; /ready reports 503 until warm-up is done
+        warm_up_task = asyncio.create_task(warm_up())
     logger.info("FastAPI application started")
 
 # Shutdown event
 @app.on_event("shutdown")
 async def shutdown_event():
-    # Stop the broadcast task
+    # Stop the warm-up, event watcher and broadcast tasks
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    if event_watcher_task is not None:
+        event_watcher_task.cancel()
     manager.stop_broadcast_task()
     # Close database connection
     db.close()
@@ -105,4 +257,4 @@ async def shutdown_event():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="localhost", port=8000)
+    uvicorn.run(app, host="localhost", port=8000, ws_per_message_deflate=get_settings().WS_PER_MESSAGE_DEFLATE)
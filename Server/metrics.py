@@ -0,0 +1,322 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Sequence, Optional
+
+# Default latency buckets in seconds, tuned for a 1 s broadcast tick
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_names: Sequence[str], label_values: Tuple[str, ...], extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.extend(extra.items())
+    if not pairs:
+        return ""
+    body = ",".join(f'{name}="{_escape_label_value(str(value))}"' for name, value in pairs)
+    return "{" + body + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Base class for a labelled metric family"""
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    self._children[key] = child
+        return child
+
+    def _default_child(self):
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def _family_name(self) -> str:
+        return self.name
+
+    def render(self) -> str:
+        # HELP/TYPE must name the samples exactly or Prometheus treats them as untyped
+        lines = [
+            f"# HELP {self._family_name()} {self.documentation}",
+            f"# TYPE {self._family_name()} {self.metric_type}",
+        ]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+    metric_type = "counter"
+
+    def _family_name(self) -> str:
+        return f"{self.name}_total"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default_child().inc(amount)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self._family_name()}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+            for key, child in list(self._children.items())
+        ]
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    metric_type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default_child().set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._default_child().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default_child().dec(amount)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+            for key, child in list(self._children.items())
+        ]
+
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "bucket_counts", "count", "sum")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        self.bucket_counts = [0] * len(upper_bounds)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        # Buckets are stored non-cumulatively and summed at render time
+        self.bucket_counts[bisect_left(self.upper_bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in fixed buckets"""
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        bounds = sorted(float(b) for b in buckets)
+        if not bounds or bounds[-1] != float("inf"):
+            bounds.append(float("inf"))
+        self.upper_bounds = tuple(bounds)
+
+    def _new_child(self):
+        return _HistogramChild(self.upper_bounds)
+
+    def observe(self, value: float):
+        self._default_child().observe(value)
+
+    def time(self):
+        return self._default_child().time()
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, child in list(self._children.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(child.upper_bounds, child.bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, {"le": _format_value(bound)})
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_count{labels} {child.count}")
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together on /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def generate_latest(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = Registry()
+
+# Hot-path timings
+QUERY_DURATION = registry.register(Histogram(
+    "remanet_query_duration_seconds",
+    "Time spent executing MongoDB queries",
+    ["collection"],
+))
+PROCESSING_DURATION = registry.register(Histogram(
+    "remanet_processing_duration_seconds",
+    "Time spent turning raw documents into response rows",
+    ["collection"],
+))
+ROWS_PROCESSED = registry.register(Counter(
+    "remanet_rows_processed",
+    "Number of documents processed per collection",
+    ["collection"],
+))
+MAINTENANCE_CHECK_DURATION = registry.register(Histogram(
+    "remanet_maintenance_check_duration_seconds",
+    "Time spent evaluating predictive maintenance rules",
+))
+SERIALIZATION_DURATION = registry.register(Histogram(
+    "remanet_serialization_duration_seconds",
+    "Time spent encoding WebSocket payloads to JSON",
+    ["message_type"],
+))
+SEND_DURATION = registry.register(Histogram(
+    "remanet_send_duration_seconds",
+    "Time spent writing a payload to a WebSocket",
+    ["message_type"],
+))
+BROADCAST_DURATION = registry.register(Histogram(
+    "remanet_broadcast_tick_duration_seconds",
+    "Wall time of one broadcast tick, fetch to last send",
+    ["channel"],
+))
+
+# Transport counters
+BYTES_SENT = registry.register(Counter(
+    "remanet_ws_bytes_sent",
+    "Bytes written to WebSocket clients",
+    ["message_type"],
+))
+MESSAGES_SENT = registry.register(Counter(
+    "remanet_ws_messages_sent",
+    "Messages written to WebSocket clients",
+    ["message_type"],
+))
+MESSAGES_DROPPED = registry.register(Counter(
+    "remanet_ws_messages_dropped",
+    "Messages that could not be delivered to a WebSocket client",
+    ["message_type"],
+))
+ACTIVE_CONNECTIONS = registry.register(Gauge(
+    "remanet_ws_active_connections",
+    "Currently connected WebSocket clients",
+))
+SEND_QUEUE_DEPTH = registry.register(Gauge(
+    "remanet_ws_send_queue_depth",
+    "Clients still waiting for the current broadcast tick",
+))
+ROWS_INGESTED = registry.register(Counter(
+    "remanet_rows_ingested",
+    "Number of documents written through the ingest path",
+    ["collection"],
+))
+EVENTS_RECORDED = registry.register(Counter(
+    "remanet_events_recorded",
+    "Threshold and maintenance events opened at ingest time",
+    ["severity"],
+))
+TIME_TO_FIRST_BYTE = registry.register(Histogram(
+    "remanet_ws_time_to_first_byte_seconds",
+    "Time from WebSocket connect to the first data message being sent",
+))
+STARTUP_PHASE_DURATION = registry.register(Gauge(
+    "remanet_startup_phase_duration_seconds",
+    "Duration of each startup phase (import, mongo, pool, snapshot, ready, first_client)",
+    ["phase"],
+))
+BROADCAST_TICKS_SKIPPED = registry.register(Counter(
+    "remanet_broadcast_ticks_skipped",
+    "Broadcast ticks skipped for lack of new data or because the channel fell behind",
+    ["channel", "reason"],
+))
+BROADCAST_CHANNEL_RATE = registry.register(Gauge(
+    "remanet_broadcast_channel_rate_hz",
+    "Current effective rate of each broadcast channel",
+    ["channel"],
+))
+COMPRESSION_DURATION = registry.register(Histogram(
+    "remanet_compression_duration_seconds",
+    "CPU time spent compressing payloads",
+    ["codec"],
+))
+COMPRESSION_BYTES_SAVED = registry.register(Counter(
+    "remanet_compression_bytes_saved",
+    "Bytes saved by compression, before minus after",
+    ["codec"],
+))
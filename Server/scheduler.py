@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+from metrics import BROADCAST_DURATION, BROADCAST_TICKS_SKIPPED, BROADCAST_CHANNEL_RATE
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicChannel:
+    """
+    One broadcast channel with its own cadence
+
+    The handler returns True when it sent something and False when it had
+    nothing new to send, which is counted as a skipped tick.
+    """
+
+    def __init__(self, name: str, interval: float, handler: Callable[[], Awaitable[bool]], max_slowdown: float = 8.0):
+        self.name = name
+        self.base_interval = interval
+        self.interval = interval
+        self.handler = handler
+        self.max_slowdown = max_slowdown
+        self.next_due: Optional[float] = None
+        BROADCAST_CHANNEL_RATE.labels(name).set(1 / interval)
+
+    def slow_down(self):
+        interval = min(self.interval * 2, self.base_interval * self.max_slowdown)
+        if interval != self.interval:
+            self.interval = interval
+            BROADCAST_CHANNEL_RATE.labels(self.name).set(1 / interval)
+            logger.warning(f"Broadcast channel {self.name} overloaded, slowing to {1 / interval:.2f} Hz")
+
+    def speed_up(self):
+        interval = max(self.interval / 2, self.base_interval)
+        if interval != self.interval:
+            self.interval = interval
+            BROADCAST_CHANNEL_RATE.labels(self.name).set(1 / interval)
+            logger.info(f"Broadcast channel {self.name} recovered to {1 / interval:.2f} Hz")
+
+
+class BroadcastScheduler:
+    """
+    Run several periodic channels from one task on a drift-free grid
+
+    Deadlines advance by a fixed interval from the previous deadline rather
+    than from when the work finished, so handler time never accumulates into
+    the period. A channel whose work no longer fits its period is slowed down
+    instead of queueing up late ticks, and is sped back up once it has slack.
+    Channels run one at a time so sends on a socket never interleave.
+    """
+
+    def __init__(self, channels: List[PeriodicChannel], overload_ratio: float = 0.8, recovery_ratio: float = 0.25):
+        self.channels = channels
+        self.overload_ratio = overload_ratio
+        self.recovery_ratio = recovery_ratio
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for channel in self.channels:
+            channel.next_due = start
+
+        while True:
+            channel = min(self.channels, key=lambda c: c.next_due)
+            delay = channel.next_due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            started = loop.time()
+            try:
+                sent = await channel.handler()
+            except Exception as e:
+                logger.error(f"Error in broadcast channel {channel.name}: {e}")
+                sent = True
+            finished = loop.time()
+            duration = finished - started
+
+            BROADCAST_DURATION.labels(channel.name).observe(duration)
+            if not sent:
+                BROADCAST_TICKS_SKIPPED.labels(channel.name, "no_new_data").inc()
+
+            if duration > channel.interval * self.overload_ratio:
+                channel.slow_down()
+            elif duration < channel.interval * self.recovery_ratio:
+                channel.speed_up()
+
+            self._advance(channel, finished)
+
+    @staticmethod
+    def _advance(channel: PeriodicChannel, now: float):
+        channel.next_due += channel.interval
+        if channel.next_due <= now:
+            # Behind schedule: drop the missed slots rather than bursting to catch up
+            missed = int((now - channel.next_due) // channel.interval) + 1
+            channel.next_due += missed * channel.interval
+            BROADCAST_TICKS_SKIPPED.labels(channel.name, "overload").inc(missed)
@@ -1,25 +1,62 @@
 from datetime import datetime, timedelta
+import asyncio
 import logging
-from typing import Optional, Dict, Any
-from database import db
-from data_generator import generate_sample_coldspray_data
+import time
+from typing import Optional, Dict, Any, List
+from database import db, machine_filter
 from config import get_settings
+from services.maintenance_service import check_predictive_maintenance
+from metrics import QUERY_DURATION, PROCESSING_DURATION, ROWS_PROCESSED
 
 logger = logging.getLogger(__name__)
 
-async def get_filtered_data(filter_date: Optional[str] = None) -> Dict[str, Any]:
-    """Get cold spray data with optional date filtering"""
+def _process_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a raw coldspray document into the row shape sent to clients"""
+    return {
+        "Time": item["Time"].isoformat() if isinstance(item["Time"], datetime) else item["Time"],
+        "T_gun": item["T_Gun"],
+        "P_gun": item["P_Gun"],
+        "Q_PG_N2": item["Q_PG_N2"],
+        "V_Particule": item.get("V_Particule", 0),
+        "Q_CG_PF1": item.get("Q_CG_PF1"),
+        "Q_CG_PF2": item.get("Q_CG_PF2", 0)
+    }
+
+async def get_filtered_data(
+    filter_date: Optional[str] = None,
+    machine_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """Get cold spray data for one machine, by day, by explicit [start, end) range or for the last hour"""
     try:
         settings = get_settings()
+        machine_id = machine_id or settings.DEFAULT_MACHINE_ID
+        if machine_id not in settings.MACHINE_IDS:
+            logger.error(f"Invalid machine id: {machine_id}")
+            return {
+                "data": [],
+                "notifications": []
+            }
         collection = db.get_collection("coldspray")
         
-        if filter_date:
+        if start is not None and end is not None:
+            # Explicit window, e.g. around a recorded event
+            query = {
+                **machine_filter(machine_id),
+                "Time": {
+                    "$gte": start,
+                    "$lt": end
+                }
+            }
+        elif filter_date:
             # Convert string to datetime for filtering
             date_obj = datetime.strptime(filter_date, "%m/%d/%Y")
             next_day = date_obj + timedelta(days=1)
             
             # Query for specific date
             query = {
+                **machine_filter(machine_id),
                 "Time": {
                     "$gte": date_obj,
                     "$lt": next_day
@@ -29,6 +66,7 @@ async def get_filtered_data(filter_date: Optional[str] = None) -> Dict[str, Any]
             # For real-time data, get the last hour of data
             one_hour_ago = datetime.now() - timedelta(hours=1)
             query = {
+                **machine_filter(machine_id),
                 "Time": {
                     "$gte": one_hour_ago
                 }
@@ -49,9 +87,11 @@ async def get_filtered_data(filter_date: Optional[str] = None) -> Dict[str, Any]
         # Try to fetch data from MongoDB
         try:
             if collection is not None:
-                cursor = collection.find(query, projection).sort("Time", 1).limit(5000)
-                data = list(cursor)
-                logger.info(f"Retrieved {len(data)} records from coldspray")
+                with QUERY_DURATION.labels("coldspray").time():
+                    cursor = collection.find(query, projection).sort("Time", 1).limit(5000)
+                    # Run the blocking fetch off the event loop so machines load concurrently
+                    data = await asyncio.to_thread(list, cursor)
+                logger.info(f"Retrieved {len(data)} records from coldspray for {machine_id}")
             else:
                 logger.error("Collection not available")
                 data = []
@@ -59,29 +99,24 @@ async def get_filtered_data(filter_date: Optional[str] = None) -> Dict[str, Any]
             logger.error(f"Database error: {db_error}")
             data = []
         
-        # If no data found, generate sample data
-        if not data:
+        # If no data found, generate sample data (never for explicit windows)
+        if not data and start is None:
             logger.info(f"No data found in database, generating sample data")
+            # Imported on demand: data_generator pulls in NumPy
+            from data_generator import generate_sample_coldspray_data
             data = generate_sample_coldspray_data()
         
         # Process data and check for notifications
         processed_data = []
         notifications = []
+        processing_started = time.perf_counter()
         
         for item in data:
-            processed_item = {
-                "Time": item["Time"].isoformat() if isinstance(item["Time"], datetime) else item["Time"],
-                "T_gun": item["T_Gun"],
-                "P_gun": item["P_Gun"],
-                "Q_PG_N2": item["Q_PG_N2"],
-                "V_Particule": item.get("V_Particule", 0),
-                "Q_CG_PF1": item.get("Q_CG_PF1"),
-                "Q_CG_PF2": item.get("Q_CG_PF2", 0)
-            }
+            processed_item = _process_item(item)
             processed_data.append(processed_item)
             
             # Generate notifications for values exceeding thresholds
-            timestamp = item["Time"].isoformat() if isinstance(item["Time"], datetime) else item["Time"]
+            timestamp = processed_item["Time"]
             
             if item["T_Gun"] > settings.MAX_T_GUN:
                 notifications.append({
@@ -90,6 +125,7 @@ async def get_filtered_data(filter_date: Optional[str] = None) -> Dict[str, Any]
                     "value": item["T_Gun"],
                     "threshold": settings.MAX_T_GUN,
                     "timestamp": timestamp,
+                    "machine_id": machine_id,
                     "message": f"T_Gun exceeded maximum threshold: {item['T_Gun']} > {settings.MAX_T_GUN}"
                 })
                 
@@ -100,6 +136,7 @@ async def get_filtered_data(filter_date: Optional[str] = None) -> Dict[str, Any]
                     "value": item["P_Gun"],
                     "threshold": settings.MAX_P_GUN,
                     "timestamp": timestamp,
+                    "machine_id": machine_id,
                     "message": f"P_Gun exceeded maximum threshold: {item['P_Gun']} > {settings.MAX_P_GUN}"
                 })
                 
@@ -110,6 +147,7 @@ async def get_filtered_data(filter_date: Optional[str] = None) -> Dict[str, Any]
                     "value": item["Q_PG_N2"],
                     "threshold": settings.MAX_Q_PG_N2,
                     "timestamp": timestamp,
+                    "machine_id": machine_id,
                     "message": f"Q_PG_N2 exceeded maximum threshold: {item['Q_PG_N2']} > {settings.MAX_Q_PG_N2}"
                 })
 
@@ -120,9 +158,13 @@ async def get_filtered_data(filter_date: Optional[str] = None) -> Dict[str, Any]
                     "value": item.get("V_Particule", 0),
                     "threshold": settings.MAX_V_PARTICULE,
                     "timestamp": timestamp,
+                    "machine_id": machine_id,
                     "message": f"V_Particule exceeded maximum threshold: {item.get('V_Particule', 0)} > {settings.MAX_V_PARTICULE}"
                 })
 
+        PROCESSING_DURATION.labels("coldspray").observe(time.perf_counter() - processing_started)
+        ROWS_PROCESSED.labels("coldspray").inc(len(processed_data))
+
         return {
             "data": processed_data,
             "notifications": notifications
@@ -133,3 +175,66 @@ async def get_filtered_data(filter_date: Optional[str] = None) -> Dict[str, Any]
             "data": [],
             "notifications": []
         }
+
+async def get_latest_time(machine_id: Optional[str] = None) -> Optional[datetime]:
+    """Get the time of a machine's newest cold spray reading, cheap enough to poll every tick"""
+    try:
+        collection = db.get_collection("coldspray")
+        if collection is None:
+            return None
+        with QUERY_DURATION.labels("coldspray_latest").time():
+            item = await asyncio.to_thread(
+                collection.find_one, machine_filter(machine_id), {"Time": 1, "_id": 0}, sort=[("Time", -1)]
+            )
+        return item["Time"] if item else None
+    except Exception as e:
+        logger.error(f"Error in get_latest_time: {e}")
+        return None
+
+async def get_fleet_overview() -> List[Dict[str, Any]]:
+    """Get the latest cold spray reading and maintenance state of every machine"""
+    try:
+        settings = get_settings()
+        collection = db.get_collection("coldspray")
+        fields = ["Time", "T_Gun", "P_Gun", "Q_PG_N2", "V_Particule", "Q_CG_PF1", "Q_CG_PF2"]
+
+        latest_by_machine = {}
+        if collection is not None:
+            # Sorting both keys descending walks the (machine_id, Time) index
+            # backwards, letting $sort + $group/$first use a DISTINCT_SCAN that
+            # reads one entry per machine. null covers untagged legacy rows.
+            pipeline = [
+                {"$match": {"machine_id": {"$in": settings.MACHINE_IDS + [None]}}},
+                {"$sort": {"machine_id": -1, "Time": -1}},
+                {"$group": {
+                    "_id": "$machine_id",
+                    **{field: {"$first": f"${field}"} for field in fields}
+                }}
+            ]
+            with QUERY_DURATION.labels("coldspray_fleet").time():
+                results = await asyncio.to_thread(list, collection.aggregate(pipeline))
+            for item in results:
+                machine_id = item.pop("_id") or settings.DEFAULT_MACHINE_ID
+                # Untagged legacy rows and default-machine rows form two groups
+                current = latest_by_machine.get(machine_id)
+                if current is None or item["Time"] > current["Time"]:
+                    latest_by_machine[machine_id] = item
+        else:
+            logger.error("Collection not available")
+
+        overview = []
+        for machine_id in settings.MACHINE_IDS:
+            item = latest_by_machine.get(machine_id)
+            latest = _process_item(item) if item is not None else None
+            maintenance_required = await check_predictive_maintenance(
+                {"cold_spray": [latest] if latest else []}
+            )
+            overview.append({
+                "machine_id": machine_id,
+                "latest": latest,
+                "maintenance_required": maintenance_required
+            })
+        return overview
+    except Exception as e:
+        logger.error(f"Error in get_fleet_overview: {e}")
+        return []
@@ -0,0 +1,437 @@
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import math
+from itertools import islice
+from typing import Optional, List, Dict, Any, Tuple
+from database import db, machine_filter
+from config import get_settings
+from metrics import QUERY_DURATION, EVENTS_RECORDED
+from services.coldspray_service import get_filtered_data
+from services.microphone_service import get_mic_data
+
+logger = logging.getLogger(__name__)
+
+# Raw field, client-facing parameter name, settings threshold, severity.
+# Mirrors the notification checks in coldspray_service and the rules in
+# maintenance_service so events line up with what clients already see.
+EVENT_RULES = [
+    ("T_Gun", "T_gun", "MAX_T_GUN", "warning"),
+    ("P_Gun", "P_gun", "MAX_P_GUN", "warning"),
+    ("Q_PG_N2", "Q_PG_N2", "MAX_Q_PG_N2", "warning"),
+    ("V_Particule", "V_Particule", "MAX_V_PARTICULE", "warning"),
+    ("T_Gun", "T_gun", "T_GUN_MAINTENANCE_THRESHOLD", "maintenance"),
+    ("P_Gun", "P_gun", "P_GUN_MAINTENANCE_THRESHOLD", "maintenance"),
+    ("Q_PG_N2", "Q_PG_N2", "Q_PG_N2_MAINTENANCE_THRESHOLD", "maintenance"),
+    ("V_Particule", "V_Particule", "V_PARTICULE_MAINTENANCE_THRESHOLD", "maintenance"),
+]
+
+# Events still being extended, keyed by (machine_id, parameter, severity)
+_open_events: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+
+# None until the watcher has tried to open a change stream
+_change_streams_available: Optional[bool] = None
+
+# OperationFailure codes: $changeStream needs a replica set (40573) or the
+# resume point has left the oplog (286 ChangeStreamHistoryLost, 280 ChangeStreamFatalError)
+CHANGE_STREAMS_UNSUPPORTED = {40573}
+CHANGE_STREAM_HISTORY_LOST = {286, 280}
+
+
+def _serialize_event(event: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": str(event["_id"]),
+        "machine_id": event["machine_id"],
+        "parameter": event["parameter"],
+        "severity": event["severity"],
+        "threshold": event["threshold"],
+        "start": event["start"].isoformat(),
+        "end": event["end"].isoformat(),
+        "peak": event["peak"],
+        "peak_time": event["peak_time"].isoformat(),
+        "samples": event["samples"],
+    }
+
+
+def _detect(rows: List[Dict[str, Any]], machine_id: str,
+            open_events: Dict[Tuple[str, str, str], Dict[str, Any]]) -> Tuple[List[Any], List[str]]:
+    """Fold a time-ordered batch into `open_events`, returning the Mongo writes and new events' severities"""
+    # bson/pymongo are imported on use so server startup does not pay for them
+    from bson import ObjectId
+    from pymongo import InsertOne, UpdateOne
+
+    settings = get_settings()
+    gap = timedelta(seconds=settings.EVENT_GAP_SECONDS)
+    max_duration = timedelta(seconds=settings.EVENT_MAX_DURATION_SECONDS)
+    pending: Dict[Any, Dict[str, Any]] = {}
+    inserted = set()
+    created: List[str] = []
+
+    for row in rows:
+        timestamp = row["Time"]
+        for field, parameter, threshold_name, severity in EVENT_RULES:
+            value = row.get(field)
+            # CSV imports carry NaN for missing readings; they neither open nor close an event
+            if not isinstance(value, (int, float)) or not math.isfinite(value):
+                continue
+            key = (machine_id, parameter, severity)
+            event = open_events.get(key)
+            threshold = getattr(settings, threshold_name)
+
+            # Same test as the coldspray_service notifications
+            if not value > threshold:
+                if event is not None:
+                    del open_events[key]
+                continue
+
+            # Long excursions are split so every event fits in EVENT_MAX_DURATION_SECONDS,
+            # which is what lets get_events bound its index scan on start
+            if (event is not None and timestamp - event["end"] <= gap
+                    and timestamp - event["start"] <= max_duration):
+                event["end"] = timestamp
+                event["samples"] += 1
+                if value > event["peak"]:
+                    event["peak"] = value
+                    event["peak_time"] = timestamp
+            else:
+                event = {
+                    "_id": ObjectId(),
+                    "machine_id": machine_id,
+                    "parameter": parameter,
+                    "severity": severity,
+                    "threshold": threshold,
+                    "start": timestamp,
+                    "end": timestamp,
+                    "peak": value,
+                    "peak_time": timestamp,
+                    "samples": 1,
+                }
+                open_events[key] = event
+                inserted.add(event["_id"])
+                created.append(severity)
+            pending[event["_id"]] = event
+
+    operations = []
+    for event_id, event in pending.items():
+        if event_id in inserted:
+            operations.append(InsertOne(dict(event)))
+        else:
+            operations.append(UpdateOne({"_id": event_id}, {"$set": {
+                "end": event["end"],
+                "peak": event["peak"],
+                "peak_time": event["peak_time"],
+                "samples": event["samples"],
+            }}))
+    return operations, created
+
+
+def _write_events(rows: List[Dict[str, Any]], open_events: Optional[Dict[Tuple[str, str, str], Dict[str, Any]]] = None) -> int:
+    """
+    Detect events in a batch of coldspray rows and persist them (blocking)
+
+    Raises on a failed write, after restoring the open-event state, so the
+    caller can retry the same rows.
+    """
+    collection = db.get_collection("events")
+    if collection is None:
+        logger.error("Collection events not available")
+        return 0
+
+    default_machine = get_settings().DEFAULT_MACHINE_ID
+    by_machine: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        # Rows written by data_extraction.py carry no machine_id
+        if row.get("Time") is not None:
+            by_machine.setdefault(row.get("machine_id") or default_machine, []).append(row)
+
+    operations = []
+    created: List[str] = []
+    snapshots = []
+    for machine_id, machine_rows in by_machine.items():
+        machine_rows.sort(key=lambda row: row["Time"])
+        state = open_events
+        if state is None:
+            state = _open_events
+            latest_end = max(
+                (event["end"] for key, event in _open_events.items() if key[0] == machine_id),
+                default=None,
+            )
+            if latest_end is not None and machine_rows[0]["Time"] < latest_end:
+                # Older than the live stream (e.g. a CSV import of a past day):
+                # detect it on its own so it cannot extend a live event
+                state = {}
+        if not any(state is saved for saved, _ in snapshots):
+            snapshots.append((state, {key: dict(event) for key, event in state.items()}))
+        machine_operations, machine_created = _detect(machine_rows, machine_id, state)
+        operations.extend(machine_operations)
+        created.extend(machine_created)
+
+    if operations:
+        try:
+            with QUERY_DURATION.labels("events_write").time():
+                collection.bulk_write(operations, ordered=True)
+        except Exception:
+            for state, snapshot in snapshots:
+                state.clear()
+                state.update(snapshot)
+            raise
+    for severity in created:
+        EVENTS_RECORDED.labels(severity).inc()
+    return len(operations)
+
+
+async def record_events(rows: List[Dict[str, Any]]) -> int:
+    """
+    Detect threshold and maintenance excursions in newly stored rows
+
+    Consecutive out-of-bounds readings are merged into one event per
+    machine, parameter and severity, extended across batches.
+
+    Args:
+        rows: Cold spray documents; untagged rows belong to DEFAULT_MACHINE_ID
+
+    Returns:
+        Number of events created or extended
+    """
+    try:
+        return await asyncio.to_thread(_write_events, rows)
+    except Exception as e:
+        logger.error(f"Error recording events, run backfill_events for these rows: {e}")
+        return 0
+
+
+def _watch_batch(stream, limit: int) -> List[Dict[str, Any]]:
+    """Pull up to `limit` inserted documents from a change stream (blocking)"""
+    documents = []
+    while len(documents) < limit:
+        change = stream.try_next()
+        if change is None:
+            break
+        documents.append(change["fullDocument"])
+    return documents
+
+
+def change_streams_unavailable() -> bool:
+    """True once the watcher found the server cannot serve change streams"""
+    return _change_streams_available is False
+
+
+async def watch_coldspray_inserts(batch_size: int = 5000):
+    """
+    Record events for every row inserted into coldspray, whoever wrote it
+
+    Follows a change stream, so rows from data_extraction.py and any other
+    direct insert_many writer are covered, not just the ingest service. The
+    resume token is stored in events_meta only once a batch's events are
+    written, so a failed write is retried and a restart picks up where it left
+    off; rows inserted while the stream could not resume need backfill_events.
+    """
+    global _change_streams_available
+    from pymongo.errors import OperationFailure
+
+    collection = db.get_collection("coldspray")
+    meta = db.get_collection("events_meta")
+    if collection is None or meta is None:
+        logger.error("Collection coldspray not available, event watcher not started")
+        return
+
+    pipeline = [{"$match": {"operationType": "insert"}}]
+    state = await asyncio.to_thread(meta.find_one, {"_id": "coldspray_watch"})
+    resume_token = state.get("resume_token") if state else None
+
+    while True:
+        try:
+            stream = await asyncio.to_thread(
+                collection.watch, pipeline, resume_after=resume_token, max_await_time_ms=1000
+            )
+            _change_streams_available = True
+            logger.info("Watching coldspray inserts for events")
+            with stream:
+                while True:
+                    documents = await asyncio.to_thread(_watch_batch, stream, batch_size)
+                    if documents:
+                        # Raises on failure, so the token below is not advanced past unwritten events
+                        await asyncio.to_thread(_write_events, documents)
+                    if stream.resume_token is not None and stream.resume_token != resume_token:
+                        await asyncio.to_thread(
+                            meta.update_one,
+                            {"_id": "coldspray_watch"},
+                            {"$set": {"resume_token": stream.resume_token}},
+                            upsert=True,
+                        )
+                        resume_token = stream.resume_token
+        except asyncio.CancelledError:
+            raise
+        except OperationFailure as e:
+            if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                # Standalone mongod: fall back to recording events on the ingest path
+                _change_streams_available = False
+                logger.error(
+                    "Change streams unavailable (MongoDB is not a replica set); events are only "
+                    "recorded for rows sent through /ingest, run backfill_events for other writers"
+                )
+                return
+            if e.code in CHANGE_STREAM_HISTORY_LOST and resume_token is not None:
+                logger.error(f"Event watcher could not resume ({e}), restarting from now; run backfill_events for the gap")
+                resume_token = None
+                continue
+            logger.error(f"Error in event watcher, retrying from the last written batch: {e}")
+            await asyncio.sleep(5)
+        except Exception as e:
+            # Write failures land here too; the stream reopens at the saved token and replays the batch
+            logger.error(f"Error in event watcher, retrying from the last written batch: {e}")
+            await asyncio.sleep(5)
+
+
+async def backfill_events(start: datetime, end: datetime, machine_id: Optional[str] = None, batch_size: int = 5000) -> int:
+    """
+    Rebuild events from coldspray rows already stored in [start, end)
+
+    Existing events starting in the range are replaced, so the backfill can be
+    re-run safely.
+
+    Returns:
+        Number of events written
+    """
+    settings = get_settings()
+    machines = [machine_id] if machine_id else settings.MACHINE_IDS
+    coldspray = db.get_collection("coldspray")
+    events = db.get_collection("events")
+    if coldspray is None or events is None:
+        logger.error("Collections not available, backfill skipped")
+        return 0
+
+    written = 0
+    for machine in machines:
+        await asyncio.to_thread(
+            events.delete_many,
+            {"machine_id": machine, "start": {"$gte": start, "$lt": end}},
+        )
+        cursor = coldspray.find(
+            {**machine_filter(machine), "Time": {"$gte": start, "$lt": end}},
+            {"_id": 0},
+        ).sort("Time", 1).batch_size(batch_size)
+
+        # One state per machine so events carry across chunk boundaries
+        state: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        while True:
+            chunk = await asyncio.to_thread(list, islice(cursor, batch_size))
+            if not chunk:
+                break
+            for row in chunk:
+                row["machine_id"] = machine
+            written += await asyncio.to_thread(_write_events, chunk, state)
+        logger.info(f"Backfilled events for {machine} between {start} and {end}")
+    return written
+
+
+async def get_events(
+    start: datetime,
+    end: datetime,
+    machine_id: Optional[str] = None,
+    parameter: Optional[str] = None,
+    severity: Optional[str] = None,
+    limit: int = 1000
+) -> List[Dict[str, Any]]:
+    """Get events overlapping [start, end], newest first"""
+    try:
+        collection = db.get_collection("events")
+        if collection is None:
+            logger.error("Collection events not available")
+            return []
+
+        # Events never last longer than EVENT_MAX_DURATION_SECONDS, so anything
+        # overlapping the range must also start no earlier than this bound
+        max_duration = timedelta(seconds=get_settings().EVENT_MAX_DURATION_SECONDS)
+        query: Dict[str, Any] = {
+            "start": {"$gte": start - max_duration, "$lte": end},
+            "end": {"$gte": start},
+        }
+        if machine_id:
+            query["machine_id"] = machine_id
+        if parameter:
+            query["parameter"] = parameter
+        if severity:
+            query["severity"] = severity
+
+        with QUERY_DURATION.labels("events").time():
+            cursor = collection.find(query).sort("start", -1).limit(limit)
+            events = await asyncio.to_thread(list, cursor)
+        return [_serialize_event(event) for event in events]
+    except Exception as e:
+        logger.error(f"Error in get_events: {e}")
+        return []
+
+
+async def get_event(event_id: str) -> Optional[Dict[str, Any]]:
+    """Get a single raw event document, or None if it does not exist"""
+    from bson import ObjectId
+    from bson.errors import InvalidId
+
+    try:
+        collection = db.get_collection("events")
+        if collection is None:
+            logger.error("Collection events not available")
+            return None
+        with QUERY_DURATION.labels("events").time():
+            return await asyncio.to_thread(collection.find_one, {"_id": ObjectId(event_id)})
+    except InvalidId:
+        logger.error(f"Invalid event id: {event_id}")
+        return None
+    except Exception as e:
+        logger.error(f"Error in get_event: {e}")
+        return None
+
+
+async def get_event_window(event_id: str, padding_seconds: float = 60) -> Optional[Dict[str, Any]]:
+    """Get an event with the raw cold spray and mic data surrounding it"""
+    event = await get_event(event_id)
+    if event is None:
+        return None
+
+    padding = timedelta(seconds=padding_seconds)
+    window_start = event["start"] - padding
+    window_end = event["end"] + padding
+    machine_id = event["machine_id"]
+
+    cold_spray_data, micro0_data, micro1_data = await asyncio.gather(
+        get_filtered_data(None, machine_id, window_start, window_end),
+        get_mic_data("micro_0", None, machine_id, window_start, window_end),
+        get_mic_data("micro_1", None, machine_id, window_start, window_end),
+    )
+    return {
+        "event": _serialize_event(event),
+        "window_start": window_start.isoformat(),
+        "window_end": window_end.isoformat(),
+        "cold_spray": cold_spray_data["data"],
+        "micro_0": micro0_data,
+        "micro_1": micro1_data,
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintain the event index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backfill = subparsers.add_parser("backfill", help="Rebuild events from stored coldspray rows")
+    backfill.add_argument("start", help="First day as MM/DD/YYYY")
+    backfill.add_argument("end", help="Last day (inclusive) as MM/DD/YYYY")
+    backfill.add_argument("--machine", default=None, help="Only this machine, default all of MACHINE_IDS")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    start = datetime.strptime(args.start, "%m/%d/%Y")
+    end = datetime.strptime(args.end, "%m/%d/%Y") + timedelta(days=1)
+    if not db.initialize():
+        raise SystemExit(1)
+    try:
+        written = asyncio.run(backfill_events(start, end, args.machine))
+        logger.info(f"Wrote {written} events")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import asyncio
+import base64
+import logging
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+from config import get_settings
+from database import db
+from metrics import QUERY_DURATION, ROWS_INGESTED
+from services.event_service import record_events, change_streams_unavailable
+
+logger = logging.getLogger(__name__)
+
+MIC_COLLECTIONS = ["micro_0", "micro_1"]
+
+
+def _insert(collection_name: str, documents: List[Dict[str, Any]], machine_id: Optional[str]) -> int:
+    if not documents:
+        return 0
+
+    settings = get_settings()
+    machine_id = machine_id or settings.DEFAULT_MACHINE_ID
+    for document in documents:
+        document.setdefault("machine_id", machine_id)
+        if document["machine_id"] not in settings.MACHINE_IDS:
+            raise ValueError(f"Invalid machine id: {document['machine_id']}")
+
+    collection = db.get_collection(collection_name)
+    if collection is None:
+        logger.error(f"Collection {collection_name} not available")
+        return 0
+
+    with QUERY_DURATION.labels(f"{collection_name}_insert").time():
+        # Unordered inserts let Mongo keep going past a single bad document
+        result = collection.insert_many(documents, ordered=False)
+    inserted = len(result.inserted_ids)
+    ROWS_INGESTED.labels(collection_name).inc(inserted)
+    return inserted
+
+
+def decode_documents(collection_name: str, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Turn JSON documents from POST /ingest back into what the collections store"""
+    time_field = "Time" if collection_name == "coldspray" else "timestamp"
+    decoded = []
+    for document in documents:
+        document = dict(document)
+        if isinstance(document.get(time_field), str):
+            document[time_field] = datetime.fromisoformat(document[time_field])
+        if collection_name in MIC_COLLECTIONS and isinstance(document.get("data"), str):
+            # Stored as raw float32 bytes, the layout microphone_service base64-encodes on the way out
+            document["data"] = base64.b64decode(document["data"])
+        decoded.append(document)
+    return decoded
+
+
+async def ingest_coldspray(rows: List[Dict[str, Any]], machine_id: Optional[str] = None) -> int:
+    """
+    Store a batch of cold spray readings
+
+    Args:
+        rows: Documents with a datetime "Time" field and the sensor columns
+        machine_id: Machine for rows that are not already tagged, defaults to DEFAULT_MACHINE_ID
+
+    Returns:
+        Number of documents inserted
+    """
+    try:
+        inserted = await asyncio.to_thread(_insert, "coldspray", rows, machine_id)
+        # Events normally come from the coldspray change-stream watcher, which
+        # covers every writer; without change streams this is the only path left
+        if inserted and change_streams_unavailable():
+            await record_events(rows)
+        return inserted
+    except Exception as e:
+        logger.error(f"Error ingesting coldspray data: {e}")
+        return 0
+
+
+async def ingest_mic(collection_name: str, frames: List[Dict[str, Any]], machine_id: Optional[str] = None) -> int:
+    """
+    Store a batch of microphone frames
+
+    Args:
+        collection_name: Target microphone collection
+        frames: Documents with a datetime "timestamp" and raw float32 "data"
+        machine_id: Machine for frames that are not already tagged, defaults to DEFAULT_MACHINE_ID
+
+    Returns:
+        Number of documents inserted
+    """
+    try:
+        if collection_name not in MIC_COLLECTIONS:
+            logger.error(f"Invalid collection name: {collection_name}")
+            return 0
+        return await asyncio.to_thread(_insert, collection_name, frames, machine_id)
+    except Exception as e:
+        logger.error(f"Error ingesting mic data: {e}")
+        return 0
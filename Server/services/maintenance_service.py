@@ -1,6 +1,7 @@
 import logging
 from typing import Dict, Any
 from config import get_settings
+from metrics import MAINTENANCE_CHECK_DURATION
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +15,12 @@ async def check_predictive_maintenance(combined_data: Dict[str, Any]) -> bool:
     Returns:
         Boolean indicating whether maintenance is required
     """
+    with MAINTENANCE_CHECK_DURATION.time():
+        return _evaluate_maintenance_rules(combined_data)
+
+
+def _evaluate_maintenance_rules(combined_data: Dict[str, Any]) -> bool:
+    """Apply the maintenance thresholds to the latest cold spray reading"""
     try:
         settings = get_settings()
         maintenance_required = False
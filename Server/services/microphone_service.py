@@ -1,30 +1,54 @@
 from datetime import datetime, timedelta
+import asyncio
 import logging
+import time
 import base64
 from typing import Optional, List, Dict, Any
-from bson.binary import Binary
-from database import db
-from data_generator import generate_mic_waveform
+from database import db, machine_filter
+from config import get_settings
+from metrics import QUERY_DURATION, PROCESSING_DURATION, ROWS_PROCESSED
 
 logger = logging.getLogger(__name__)
 
-async def get_mic_data(collection_name: str, filter_date: Optional[str] = None) -> List[Dict[str, Any]]:
-    """Get microphone data with optional date filtering"""
+async def get_mic_data(
+    collection_name: str,
+    filter_date: Optional[str] = None,
+    machine_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> List[Dict[str, Any]]:
+    """Get microphone data for one machine, by day, by explicit [start, end) range or for the last hour"""
     try:
         # Validate collection name
         if collection_name not in ["micro_0", "micro_1"]:
             logger.error(f"Invalid collection name: {collection_name}")
             return []
+
+        settings = get_settings()
+        machine_id = machine_id or settings.DEFAULT_MACHINE_ID
+        if machine_id not in settings.MACHINE_IDS:
+            logger.error(f"Invalid machine id: {machine_id}")
+            return []
             
         mic_collection = db.get_collection(collection_name)
         
-        if filter_date:
+        if start is not None and end is not None:
+            # Explicit window, e.g. around a recorded event
+            query = {
+                **machine_filter(machine_id),
+                "timestamp": {
+                    "$gte": start,
+                    "$lt": end
+                }
+            }
+        elif filter_date:
             # Convert string to datetime for filtering
             date_obj = datetime.strptime(filter_date, "%m/%d/%Y")
             next_day = date_obj + timedelta(days=1)
             
             # Query for specific date
             query = {
+                **machine_filter(machine_id),
                 "timestamp": {
                     "$gte": date_obj,
                     "$lt": next_day
@@ -34,6 +58,7 @@ async def get_mic_data(collection_name: str, filter_date: Optional[str] = None)
             # For real-time data, get the last hour of data
             one_hour_ago = datetime.now() - timedelta(hours=1)
             query = {
+                **machine_filter(machine_id),
                 "timestamp": {
                     "$gte": one_hour_ago
                 }
@@ -49,9 +74,16 @@ async def get_mic_data(collection_name: str, filter_date: Optional[str] = None)
         # Try to fetch data from MongoDB
         try:
             if mic_collection is not None:  # Changed from if mic_collection:
-                cursor = mic_collection.find(query, projection).sort("timestamp", 1).limit(10)
-                data = list(cursor)
-                logger.info(f"Retrieved {len(data)} records from {collection_name}")
+                with QUERY_DURATION.labels(collection_name).time():
+                    if start is None:
+                        # Preview: the newest frames, fetched newest-first then put back in time order
+                        cursor = mic_collection.find(query, projection).sort("timestamp", -1).limit(10)
+                        data = (await asyncio.to_thread(list, cursor))[::-1]
+                    else:
+                        # Event windows need every frame in range, not just a preview
+                        cursor = mic_collection.find(query, projection).sort("timestamp", 1).limit(1000)
+                        data = await asyncio.to_thread(list, cursor)
+                logger.info(f"Retrieved {len(data)} records from {collection_name} for {machine_id}")
             else:
                 logger.error(f"Collection {collection_name} not available")
                 data = []
@@ -59,19 +91,22 @@ async def get_mic_data(collection_name: str, filter_date: Optional[str] = None)
             logger.error(f"Database error when fetching mic data: {db_error}")
             data = []
         
-        # If no data found, generate sample data
-        if not data:
+        # If no data found, generate sample data (never for explicit windows)
+        if not data and start is None:
             logger.info(f"No data found in {collection_name}, generating sample data")
             # Generate a single sample of mic data
+            from data_generator import generate_mic_waveform
             sample = generate_mic_waveform()
             sample["mic_id"] = collection_name
             data = [sample]
         
         # Process data to be JSON serializable
         processed_data = []
+        processing_started = time.perf_counter()
         for item in data:
             # Handle data that might be binary or already processed
-            if isinstance(item.get("data"), Binary):
+            # Covers bson Binary (a bytes subclass) and the plain bytes pymongo returns for subtype 0
+            if isinstance(item.get("data"), bytes):
                 base64_data = base64.b64encode(item["data"]).decode('utf-8')
             else:
                 base64_data = item.get("data", "")
@@ -79,12 +114,34 @@ async def get_mic_data(collection_name: str, filter_date: Optional[str] = None)
             processed_item = {
                 "timestamp": item["timestamp"].isoformat() if isinstance(item["timestamp"], datetime) else item["timestamp"],
                 "data": base64_data,
-                "mic_id": collection_name
+                "mic_id": collection_name,
+                "machine_id": machine_id
             }
             processed_data.append(processed_item)
+
+        PROCESSING_DURATION.labels(collection_name).observe(time.perf_counter() - processing_started)
+        ROWS_PROCESSED.labels(collection_name).inc(len(processed_data))
             
         return processed_data
        
     except Exception as e:
         logger.error(f"Error in get_mic_data: {e}")
         return []
+
+async def get_latest_timestamp(collection_name: str, machine_id: Optional[str] = None) -> Optional[datetime]:
+    """Get the timestamp of a machine's newest frame in a mic collection, cheap enough to poll every tick"""
+    try:
+        if collection_name not in ["micro_0", "micro_1"]:
+            logger.error(f"Invalid collection name: {collection_name}")
+            return None
+        mic_collection = db.get_collection(collection_name)
+        if mic_collection is None:
+            return None
+        with QUERY_DURATION.labels(f"{collection_name}_latest").time():
+            item = await asyncio.to_thread(
+                mic_collection.find_one, machine_filter(machine_id), {"timestamp": 1, "_id": 0}, sort=[("timestamp", -1)]
+            )
+        return item["timestamp"] if item else None
+    except Exception as e:
+        logger.error(f"Error in get_latest_timestamp: {e}")
+        return None
@@ -1,131 +1,347 @@
 import json
 import logging
 import asyncio
+import time
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Any, Tuple
 from fastapi import WebSocket
 from config import get_settings
-from services.coldspray_service import get_filtered_data
-from services.microphone_service import get_mic_data
+from compression import EncodedMessage, available_codecs
+from scheduler import BroadcastScheduler, PeriodicChannel
+from services.coldspray_service import get_filtered_data, get_latest_time
+from services.microphone_service import get_mic_data, get_latest_timestamp
 from services.maintenance_service import check_predictive_maintenance
+from metrics import (
+    SERIALIZATION_DURATION,
+    SEND_DURATION,
+    BYTES_SENT,
+    MESSAGES_SENT,
+    MESSAGES_DROPPED,
+    ACTIVE_CONNECTIONS,
+    SEND_QUEUE_DEPTH,
+    TIME_TO_FIRST_BYTE,
+    STARTUP_PHASE_DURATION,
+)
 
 logger = logging.getLogger(__name__)
 
+async def build_snapshot(machine_id: str, filter_date: Optional[str]) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+    """Fetch every sensor of one machine concurrently and assemble the outgoing payloads"""
+    cold_spray_data, micro0_data, micro1_data = await asyncio.gather(
+        get_filtered_data(filter_date, machine_id),
+        get_mic_data("micro_0", filter_date, machine_id),
+        get_mic_data("micro_1", filter_date, machine_id),
+    )
+
+    # Create combined data object
+    combined_data = {
+        "machine_id": machine_id,
+        "cold_spray": cold_spray_data["data"],
+        "micro_0": micro0_data,
+        "micro_1": micro1_data
+    }
+
+    # Create notifications data object
+    notifications_data = {
+        "machine_id": machine_id,
+        "notifications": cold_spray_data["notifications"]
+    }
+
+    # Check for maintenance requirements
+    maintenance_required = await check_predictive_maintenance(combined_data)
+    maintenance_data = {
+        "machine_id": machine_id,
+        "maintenance_required": maintenance_required
+    }
+
+    return combined_data, notifications_data, maintenance_data
+
 class ConnectionManager:
     def __init__(self):
         self.active_connections: List[WebSocket] = []
         self.connection_filters: Dict[WebSocket, Optional[str]] = {}
+        self.connection_machines: Dict[WebSocket, str] = {}
+        # Most recent unfiltered snapshot per machine, as (loop time, snapshot)
+        self.latest_snapshots: Dict[str, Tuple[float, Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]]] = {}
+        self.first_client_ttfb: Optional[float] = None
+        # Codec each client asked for with /ws?compression=..., None for plain text
+        self.connection_compression: Dict[WebSocket, Optional[str]] = {}
+        # Loop time of the last message sent to each client, for idle keep-alives
+        self.last_sent: Dict[WebSocket, float] = {}
+        # Newest data timestamp already broadcast, keyed by (channel, machine_id)
+        self.last_seen: Dict[Tuple[str, str], Any] = {}
         self.broadcast_task = None
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket, compression: Optional[str] = None):
+        connected_at = time.perf_counter()
         await websocket.accept()
         self.active_connections.append(websocket)
+        if compression is not None and compression not in available_codecs():
+            logger.error(f"Unsupported compression {compression}, sending uncompressed")
+            compression = None
+        self.connection_compression[websocket] = compression
         self.connection_filters[websocket] = None
+        self.connection_machines[websocket] = get_settings().DEFAULT_MACHINE_ID
+        ACTIVE_CONNECTIONS.set(len(self.active_connections))
         logger.info(f"Client connected. Total connections: {len(self.active_connections)}")
         
         # Send initial data - including mic data
-        await self._send_data_to_client(websocket, None)
+        await self._send_data_to_client(websocket, None, self.connection_machines[websocket], connected_at)
 
     def disconnect(self, websocket: WebSocket):
         if websocket in self.active_connections:
             self.active_connections.remove(websocket)
         if websocket in self.connection_filters:
             del self.connection_filters[websocket]
+        if websocket in self.connection_machines:
+            del self.connection_machines[websocket]
+        self.last_sent.pop(websocket, None)
+        self.connection_compression.pop(websocket, None)
+        ACTIVE_CONNECTIONS.set(len(self.active_connections))
         logger.info(f"Client disconnected. Remaining connections: {len(self.active_connections)}")
 
-    async def update_filter(self, websocket: WebSocket, filter_date: Optional[str]):
-        self.connection_filters[websocket] = filter_date
-        logger.info(f"Updated filter to {filter_date}")
+    async def update_subscription(self, websocket: WebSocket, message: Dict[str, Any]):
+        """Apply filter_date and/or machine_id from a client message and resend data"""
+        if "filter_date" in message:
+            self.connection_filters[websocket] = message["filter_date"]
+            logger.info(f"Updated filter to {message['filter_date']}")
+
+        if "machine_id" in message:
+            machine_id = message["machine_id"] or get_settings().DEFAULT_MACHINE_ID
+            if machine_id in get_settings().MACHINE_IDS:
+                self.connection_machines[websocket] = machine_id
+                logger.info(f"Updated machine to {machine_id}")
+            else:
+                logger.error(f"Invalid machine id: {machine_id}")
         
         # Send immediate filtered data
-        await self._send_data_to_client(websocket, filter_date)
+        await self._send_data_to_client(
+            websocket,
+            self.connection_filters.get(websocket),
+            self.connection_machines.get(websocket),
+        )
 
-    async def _send_data_to_client(self, websocket: WebSocket, filter_date: Optional[str]):
-        """Send data to a specific client with optional filtering"""
-        try:
-            # Get data for all sensors
-            cold_spray_data = await get_filtered_data(filter_date)
-            micro0_data = await get_mic_data("micro_0", filter_date)
-            micro1_data = await get_mic_data("micro_1", filter_date)
-            
-            # Create combined data object
-            combined_data = {
-                "cold_spray": cold_spray_data["data"],
-                "micro_0": micro0_data,
-                "micro_1": micro1_data
-            }
+    async def get_live_snapshot(self, machine_id: str, max_age: Optional[float] = None):
+        """Return the cached live snapshot for a machine, rebuilding it when older than max_age"""
+        if max_age is None:
+            max_age = get_settings().SNAPSHOT_MAX_AGE
+        now = asyncio.get_running_loop().time()
+        cached = self.latest_snapshots.get(machine_id)
+        if cached is not None and now - cached[0] <= max_age:
+            return cached[1]
+        snapshot = await build_snapshot(machine_id, None)
+        self.latest_snapshots[machine_id] = (now, snapshot)
+        return snapshot
 
-            # Create notifications data object
-            notifications_data = {
-                "notifications": cold_spray_data["notifications"]
-            }
+    @staticmethod
+    def _serialize(message_type: str, payload: Dict) -> EncodedMessage:
+        """Encode a payload to JSON, timing it per message type"""
+        with SERIALIZATION_DURATION.labels(message_type).time():
+            return EncodedMessage(json.dumps(payload))
 
-            # Check for maintenance requirements
-            maintenance_required = await check_predictive_maintenance(combined_data)
-            maintenance_data = {
-                "maintenance_required": maintenance_required
-            }
+    async def _send_message(self, websocket: WebSocket, message_type: str, message: EncodedMessage):
+        """Send an encoded message, compressed if the client asked for it, and record its size and latency"""
+        codec = self.connection_compression.get(websocket)
+        try:
+            with SEND_DURATION.labels(message_type).time():
+                if codec is not None and message.compressible:
+                    data = message.compressed(codec)
+                    await websocket.send_bytes(data)
+                    size = len(data)
+                else:
+                    await websocket.send_text(message.text)
+                    # json.dumps escapes non-ASCII by default, so characters == bytes
+                    size = len(message.text)
+        except Exception:
+            MESSAGES_DROPPED.labels(message_type).inc()
+            raise
+        self.last_sent[websocket] = asyncio.get_running_loop().time()
+        MESSAGES_SENT.labels(message_type).inc()
+        BYTES_SENT.labels(message_type).inc(size)
+
+    async def _send_data_to_client(self, websocket: WebSocket, filter_date: Optional[str], machine_id: Optional[str],
+                                   connected_at: Optional[float] = None):
+        """Send data for one machine to a specific client with optional filtering"""
+        try:
+            machine_id = machine_id or get_settings().DEFAULT_MACHINE_ID
+            if filter_date is None:
+                # Live view: a recent cached snapshot is good enough, the next tick refreshes it
+                snapshot = await self.get_live_snapshot(machine_id)
+            else:
+                snapshot = await build_snapshot(machine_id, filter_date)
+            combined_data, notifications_data, maintenance_data = snapshot
 
             # Send data
-            await websocket.send_text(json.dumps(combined_data))
-            await websocket.send_text(json.dumps(notifications_data))
-            await websocket.send_text(json.dumps(maintenance_data))
+            await self._send_message(websocket, "data", self._serialize("data", combined_data))
+            if connected_at is not None:
+                self._record_time_to_first_byte(time.perf_counter() - connected_at)
+            await self._send_message(websocket, "notifications", self._serialize("notifications", notifications_data))
+            await self._send_message(websocket, "maintenance", self._serialize("maintenance", maintenance_data))
         except Exception as e:
             logger.error(f"Error sending data to client: {e}")
             self.disconnect(websocket)
 
-    async def broadcast_real_time_data(self):
-        """Broadcast real-time data to clients without filters"""
-        settings = get_settings()
-        while True:
+    def _record_time_to_first_byte(self, elapsed: float):
+        TIME_TO_FIRST_BYTE.observe(elapsed)
+        if self.first_client_ttfb is None:
+            self.first_client_ttfb = elapsed
+            STARTUP_PHASE_DURATION.labels("first_client").set(elapsed)
+            logger.info(f"First client time-to-first-byte: {elapsed * 1000:.1f} ms")
+
+    def _live_subscribers(self) -> Dict[str, List[WebSocket]]:
+        """Group clients without a date filter by the machine they watch"""
+        default_machine = get_settings().DEFAULT_MACHINE_ID
+        subscribers: Dict[str, List[WebSocket]] = {}
+        for websocket in self.active_connections:
+            if self.connection_filters.get(websocket) is None:
+                machine_id = self.connection_machines.get(websocket, default_machine)
+                subscribers.setdefault(machine_id, []).append(websocket)
+        return subscribers
+
+    def _has_new_data(self, channel: str, machine_id: str, fingerprint: Any) -> bool:
+        """Record the newest timestamp seen for a channel and report whether it moved"""
+        key = (channel, machine_id)
+        # No timestamp means no database data; the sample fallback is always treated as new
+        if fingerprint is None or all(part is None for part in fingerprint):
+            return True
+        if self.last_seen.get(key) == fingerprint:
+            return False
+        self.last_seen[key] = fingerprint
+        return True
+
+    def _update_cached_snapshot(self, machine_id: str, combined: Optional[Dict[str, Any]] = None,
+                                notifications: Optional[Dict[str, Any]] = None,
+                                maintenance: Optional[Dict[str, Any]] = None):
+        """Fold a partial channel update into the cached live snapshot"""
+        cached = self.latest_snapshots.get(machine_id)
+        if cached is None:
+            return
+        cached_combined, cached_notifications, cached_maintenance = cached[1]
+        self.latest_snapshots[machine_id] = (asyncio.get_running_loop().time(), (
+            {**cached_combined, **(combined or {})},
+            notifications or cached_notifications,
+            maintenance or cached_maintenance,
+        ))
+
+    async def _merged_data(self, machine_id: str) -> Dict[str, Any]:
+        """Full "data" payload for a machine, after a channel folded its update into the cache"""
+        # The update just refreshed the cache, so this only rebuilds if nothing was cached yet
+        snapshot = await self.get_live_snapshot(machine_id)
+        return snapshot[0]
+
+    async def _broadcast(self, websockets: List[WebSocket], message_type: str, payload: Dict[str, Any]):
+        """Encode (and compress) once and send to every given client"""
+        message = self._serialize(message_type, payload)
+        SEND_QUEUE_DEPTH.inc(len(websockets))
+        for websocket in websockets:
             try:
-                # Only fetch data if there are connections
-                if self.active_connections:
-                    # Get real-time data for all sensors
-                    cold_spray_data = await get_filtered_data(None)
-                    micro0_data = await get_mic_data("micro_0", None)
-                    micro1_data = await get_mic_data("micro_1", None)
-                    
-                    # Create combined data object
-                    combined_data = {
-                        "cold_spray": cold_spray_data["data"],
-                        "micro_0": micro0_data,
-                        "micro_1": micro1_data
-                    }
-
-                    # Create notifications data object
-                    notifications_data = {
-                        "notifications": cold_spray_data["notifications"]
-                    }
-
-                    # Check for maintenance requirements
-                    maintenance_required = await check_predictive_maintenance(combined_data)
-                    maintenance_data = {
-                        "maintenance_required": maintenance_required
-                    }
-                    
-                    # Send to each connection that doesn't have a filter
-                    for websocket in self.active_connections.copy():
-                        try:
-                            if self.connection_filters.get(websocket) is None:
-                                await websocket.send_text(json.dumps(combined_data))
-                                await websocket.send_text(json.dumps(notifications_data))
-                                await websocket.send_text(json.dumps(maintenance_data))
-                            
-                            # Send ping to all connections to keep them alive
-                            await websocket.send_json({
-                                "type": "ping", 
-                                "timestamp": datetime.now().isoformat()
-                            })
-                        except Exception as e:
-                            logger.error(f"Error sending to client: {e}")
-                            # Use self.disconnect to prevent calling disconnect directly
-                            self.disconnect(websocket)
+                await self._send_message(websocket, message_type, message)
             except Exception as e:
-                logger.error(f"Error in broadcast task: {e}")
-            
-            # Wait before next update
-            await asyncio.sleep(settings.BROADCAST_INTERVAL)
+                logger.error(f"Error sending to client: {e}")
+                # Use self.disconnect to prevent calling disconnect directly
+                self.disconnect(websocket)
+            finally:
+                SEND_QUEUE_DEPTH.dec()
+
+    async def _broadcast_coldspray(self) -> bool:
+        """Cold spray channel: rows and threshold notifications"""
+        subscribers = self._live_subscribers()
+        machines = list(subscribers)
+        latest = await asyncio.gather(*(get_latest_time(machine_id) for machine_id in machines))
+        changed = [
+            machine_id for machine_id, latest_time in zip(machines, latest)
+            if self._has_new_data("coldspray", machine_id, (latest_time,))
+        ]
+        if not changed:
+            return False
+
+        results = await asyncio.gather(*(get_filtered_data(None, machine_id) for machine_id in changed))
+        for machine_id, cold_spray_data in zip(changed, results):
+            combined = {"machine_id": machine_id, "cold_spray": cold_spray_data["data"]}
+            notifications = {"machine_id": machine_id, "notifications": cold_spray_data["notifications"]}
+            self._update_cached_snapshot(machine_id, combined=combined, notifications=notifications)
+            # "data" always carries the complete snapshot, the channel only decides when it goes out
+            await self._broadcast(subscribers[machine_id], "data", await self._merged_data(machine_id))
+            await self._broadcast(subscribers[machine_id], "notifications", notifications)
+        return True
+
+    async def _broadcast_mic(self) -> bool:
+        """Microphone channel: latest frames of both microphones, as a "mic" update"""
+        subscribers = self._live_subscribers()
+        machines = list(subscribers)
+        latest = await asyncio.gather(*(
+            asyncio.gather(
+                get_latest_timestamp("micro_0", machine_id),
+                get_latest_timestamp("micro_1", machine_id),
+            )
+            for machine_id in machines
+        ))
+        changed = [
+            machine_id for machine_id, timestamps in zip(machines, latest)
+            if self._has_new_data("mic", machine_id, tuple(timestamps))
+        ]
+        if not changed:
+            return False
+
+        results = await asyncio.gather(*(
+            asyncio.gather(get_mic_data("micro_0", None, machine_id), get_mic_data("micro_1", None, machine_id))
+            for machine_id in changed
+        ))
+        for machine_id, (micro0_data, micro1_data) in zip(changed, results):
+            combined = {"machine_id": machine_id, "micro_0": micro0_data, "micro_1": micro1_data}
+            self._update_cached_snapshot(machine_id, combined=combined)
+            # Mic frames alone, typed so clients merge them into the last "data" snapshot;
+            # re-sending the hour of cold spray rows at the mic rate would multiply the traffic
+            await self._broadcast(subscribers[machine_id], "mic", {"type": "mic", **combined})
+        return True
+
+    async def _broadcast_maintenance(self) -> bool:
+        """Maintenance channel: re-evaluated only when new cold spray rows arrived"""
+        subscribers = self._live_subscribers()
+        sent = False
+        for machine_id, websockets in subscribers.items():
+            cached = self.latest_snapshots.get(machine_id)
+            if cached is None:
+                continue
+            combined_data = cached[1][0]
+            if not self._has_new_data("maintenance", machine_id, self.last_seen.get(("coldspray", machine_id))):
+                continue
+            maintenance = {
+                "machine_id": machine_id,
+                "maintenance_required": await check_predictive_maintenance(combined_data)
+            }
+            self._update_cached_snapshot(machine_id, maintenance=maintenance)
+            await self._broadcast(websockets, "maintenance", maintenance)
+            sent = True
+        return sent
+
+    async def _send_keepalives(self) -> bool:
+        """Ping only clients that have been sent nothing for KEEPALIVE_INTERVAL"""
+        now = asyncio.get_running_loop().time()
+        keepalive_interval = get_settings().KEEPALIVE_INTERVAL
+        idle = [
+            websocket for websocket in self.active_connections
+            if now - self.last_sent.get(websocket, 0) >= keepalive_interval
+        ]
+        if not idle:
+            return False
+        await self._broadcast(idle, "ping", {
+            "type": "ping",
+            "timestamp": datetime.now().isoformat()
+        })
+        return True
+
+    async def broadcast_real_time_data(self):
+        """Broadcast real-time data to clients without filters, one channel per data stream"""
+        settings = get_settings()
+        scheduler = BroadcastScheduler([
+            PeriodicChannel("coldspray", settings.BROADCAST_INTERVAL, self._broadcast_coldspray, settings.BROADCAST_MAX_SLOWDOWN),
+            PeriodicChannel("mic", settings.MIC_BROADCAST_INTERVAL, self._broadcast_mic, settings.BROADCAST_MAX_SLOWDOWN),
+            PeriodicChannel("maintenance", settings.MAINTENANCE_BROADCAST_INTERVAL, self._broadcast_maintenance, settings.BROADCAST_MAX_SLOWDOWN),
+            # Checked every second, but only idle clients are pinged
+            PeriodicChannel("keepalive", 1.0, self._send_keepalives),
+        ])
+        await scheduler.run()
 
     def start_broadcast_task(self):
         """Start the broadcast task if not already running"""